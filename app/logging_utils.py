@@ -1,17 +1,22 @@
-import json
 import logging
 import sys
-from datetime import datetime
+import time
 from typing import Optional
 
+import orjson
+
 class JSONFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         log_data = {
-            "ts": datetime.utcnow().isoformat() + "Z",
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(record.created)),
             "level": record.levelname,
-            "message": record.getMessage(),
         }
-        return json.dumps(log_data)
+        payload = record.__dict__.get("payload")
+        if payload:
+            log_data.update(payload)
+        else:
+            log_data["message"] = record.getMessage()
+        return orjson.dumps(log_data).decode()
 
 def get_logger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
@@ -26,7 +31,6 @@ def get_logger(name: str) -> logging.Logger:
 def log_request(request_id: str, method: str, path: str, status: int, latency_ms: float, level: str = "INFO", extra: Optional[dict] = None) -> None:
     logger = get_logger("request")
     log_data = {
-        "ts": datetime.utcnow().isoformat() + "Z",
         "level": level,
         "request_id": request_id,
         "method": method,
@@ -36,4 +40,4 @@ def log_request(request_id: str, method: str, path: str, status: int, latency_ms
     }
     if extra:
         log_data.update(extra)
-    logger.info(json.dumps(log_data))
+    logger.info("", extra={"payload": log_data})
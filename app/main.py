@@ -1,101 +1,122 @@
 # app/main.py
-import hmac
+import base64
 import hashlib
+import hmac
+import os
+import ssl
 import uuid
 import time
 import re
-from datetime import datetime
-from typing import Optional, List
+from typing import Annotated, Any, NamedTuple, Optional, List
 
+import orjson
 from fastapi import FastAPI, Depends, status, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, validator
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func, tuple_
 
-from app.config import get_settings
-from app.storage import init_db, get_db, db_health_check
+from app.config import settings
+from app.storage import init_db, get_db, get_async_db, db_health_check, insert_ignore, text_search_filter
 from app.models import Message
 from app.logging_utils import log_request, get_logger
 from app.metrics import metrics
 
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson instead of the stdlib encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
 app = FastAPI(
     title="Lyftr AI Backend Assignment",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 logger = get_logger(__name__)
 
+# Bound once in on_startup so /webhook doesn't re-encode the secret
+_SECRET_BYTES: bytes | None = None
+_SIGNATURE_HEX_LEN = hashlib.sha256().digest_size * 2
+
+# Webhook field rules, shared by validate_webhook and the MessageRequest schema
+E164_PATTERN = r"\+\d+"
+TS_PATTERN = r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z"
+TEXT_MAX_LENGTH = 4096
+
+_is_e164 = re.compile(E164_PATTERN).fullmatch
+_is_iso8601_utc = re.compile(TS_PATTERN).fullmatch
+
 
 # ==================== Startup ====================
 
 @app.on_event("startup")
 def on_startup() -> None:
-    """Initialize database on app startup."""
+    """Initialize database and bind the webhook secret on app startup."""
+    global _SECRET_BYTES
     init_db()
+    _SECRET_BYTES = settings.WEBHOOK_SECRET.encode() if settings.WEBHOOK_SECRET else None
     logger.info("Database initialized")
+    _log_sha256_backend()
 
 
-# ==================== Pydantic Models ====================
-
-class MessageRequest(BaseModel):
-    message_id: str
-    from_field: str = Field(..., alias="from")
-    to: str
-    ts: str
-    text: Optional[str] = None
+def _log_sha256_backend() -> None:
+    """
+    Log the OpenSSL build backing hashlib and a quick SHA-256 throughput check.
+    Webhook HMAC validation relies on OpenSSL picking SHA-NI / ARMv8 crypto
+    instructions; a low figure here usually means they are masked out.
+    """
+    buf = b"\x00" * (1 << 20)
+    start = time.perf_counter()
+    for _ in range(8):
+        hashlib.sha256(buf).digest()
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "hashlib backend: %s, sha256 throughput: %.0f MB/s, OPENSSL_ia32cap=%s",
+        ssl.OPENSSL_VERSION,
+        8 / elapsed if elapsed else float("inf"),
+        os.getenv("OPENSSL_ia32cap", "unset"),
+    )
 
-    @validator("message_id")
-    def message_id_not_empty(cls, v: str) -> str:
-        if not v or not v.strip():
-            raise ValueError("message_id must not be empty")
-        return v
 
-    @validator("from_field")
-    def from_is_e164(cls, v: str) -> str:
-        if not re.match(r"^\+\d+$", v):
-            raise ValueError("from must be in E.164 format (e.g. +919876543210)")
-        return v
+# ==================== Pydantic Models ====================
 
-    @validator("to")
-    def to_is_e164(cls, v: str) -> str:
-        if not re.match(r"^\+\d+$", v):
-            raise ValueError("to must be in E.164 format (e.g. +14155550100)")
-        return v
+MsisdnStr = Annotated[str, StringConstraints(pattern=f"^{E164_PATTERN}$")]
+TimestampStr = Annotated[str, StringConstraints(pattern=f"^{TS_PATTERN}$")]
 
-    @validator("ts")
-    def ts_is_iso8601_utc(cls, v: str) -> str:
-        if not re.match(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$", v):
-            raise ValueError("ts must be ISO-8601 UTC (e.g. 2025-01-15T10:00:00Z)")
-        return v
 
-    @validator("text")
-    def text_max_length(cls, v: Optional[str]) -> Optional[str]:
-        if v and len(v) > 4096:
-            raise ValueError("text must not exceed 4096 characters")
-        return v
+# Webhook payload schema, used only for OpenAPI docs; requests are validated
+# by validate_webhook, which also rejects a blank message_id.
+class MessageRequest(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
 
-    class Config:
-        populate_by_name = True
+    message_id: str
+    from_field: MsisdnStr = Field(..., alias="from")
+    to: MsisdnStr
+    ts: TimestampStr
+    text: Optional[Annotated[str, StringConstraints(max_length=TEXT_MAX_LENGTH)]] = None
 
 
 class MessageResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     message_id: str
     from_msisdn: str
     to_msisdn: str
     ts: str
     text: Optional[str] = None
 
-    class Config:
-        from_attributes = True
-
 
 class MessagesListResponse(BaseModel):
     data: List[MessageResponse]
-    total: int
     limit: int
-    offset: int
+    has_more: bool
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
 
 
 class SenderStat(BaseModel):
@@ -111,6 +132,58 @@ class StatsResponse(BaseModel):
     last_message_ts: Optional[str] = None
 
 
+# ==================== Webhook Validation ====================
+
+class WebhookValidationError(ValueError):
+    """Raised when a webhook payload fails validation."""
+
+
+class WebhookMessage(NamedTuple):
+    message_id: str
+    from_msisdn: str
+    to_msisdn: str
+    ts: str
+    text: Optional[str]
+
+
+def _require_str(d: dict, key: str) -> str:
+    value = d.get(key)
+    if value is None:
+        raise WebhookValidationError(f"{key} is required")
+    if not isinstance(value, str):
+        raise WebhookValidationError(f"{key} must be a string")
+    return value
+
+
+def validate_webhook(d: Any) -> WebhookMessage:
+    """
+    Validate a decoded webhook payload against the MessageRequest rules.
+    Used on the hot path instead of constructing MessageRequest, which is
+    kept for the OpenAPI schema.
+    """
+    if not isinstance(d, dict):
+        raise WebhookValidationError("body must be a JSON object")
+    message_id = _require_str(d, "message_id")
+    if not message_id.strip():
+        raise WebhookValidationError("message_id must not be empty")
+    from_msisdn = _require_str(d, "from")
+    if not _is_e164(from_msisdn):
+        raise WebhookValidationError("from must be in E.164 format (e.g. +919876543210)")
+    to_msisdn = _require_str(d, "to")
+    if not _is_e164(to_msisdn):
+        raise WebhookValidationError("to must be in E.164 format (e.g. +14155550100)")
+    ts = _require_str(d, "ts")
+    if not _is_iso8601_utc(ts):
+        raise WebhookValidationError("ts must be ISO-8601 UTC (e.g. 2025-01-15T10:00:00Z)")
+    text = d.get("text")
+    if text is not None:
+        if not isinstance(text, str):
+            raise WebhookValidationError("text must be a string")
+        if len(text) > TEXT_MAX_LENGTH:
+            raise WebhookValidationError(f"text must not exceed {TEXT_MAX_LENGTH} characters")
+    return WebhookMessage(message_id, from_msisdn, to_msisdn, ts, text)
+
+
 # ==================== Health Endpoints ====================
 
 @app.get("/health/live")
@@ -125,16 +198,14 @@ def health_ready(db: Session = Depends(get_db)):
     Readiness probe: DB is reachable and WEBHOOK_SECRET is set.
     Returns 503 if either check fails.
     """
-    settings = get_settings()
-
     if not settings.WEBHOOK_SECRET:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             content={"detail": "WEBHOOK_SECRET not set"},
         )
 
     if not db_health_check(db):
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             content={"detail": "database not ready"},
         )
@@ -144,15 +215,22 @@ def health_ready(db: Session = Depends(get_db)):
 
 # ==================== Webhook Endpoint ====================
 
-@app.post("/webhook")
-async def webhook(request: Request, db: Session = Depends(get_db)):
+@app.post(
+    "/webhook",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": MessageRequest.model_json_schema(by_alias=True)}},
+        }
+    },
+)
+async def webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Ingest WhatsApp-like messages with HMAC signature validation.
     Enforces idempotency via message_id uniqueness.
     """
     request_id = str(uuid.uuid4())
     start_time = time.time()
-    settings = get_settings()
 
     # 1. Read raw body for HMAC
     try:
@@ -161,37 +239,36 @@ async def webhook(request: Request, db: Session = Depends(get_db)):
         latency_ms = (time.time() - start_time) * 1000
         metrics.record_http_request("/webhook", 400)
         log_request(request_id, "POST", "/webhook", 400, latency_ms, extra={"result": "error", "reason": "read_body"})
-        return JSONResponse(status_code=400, content={"detail": "Could not read request body"})
+        return ORJSONResponse(status_code=400, content={"detail": "Could not read request body"})
 
     # 2. Validate signature
     x_signature = request.headers.get("X-Signature")
-    if not x_signature:
+    if _SECRET_BYTES is None or not x_signature or len(x_signature) != _SIGNATURE_HEX_LEN:
         latency_ms = (time.time() - start_time) * 1000
         metrics.record_http_request("/webhook", 401)
         metrics.record_webhook_result("invalid_signature")
         metrics.record_latency(latency_ms)
         log_request(request_id, "POST", "/webhook", 401, latency_ms, extra={"result": "invalid_signature"})
-        return JSONResponse(status_code=401, content={"detail": "invalid signature"})
+        return ORJSONResponse(status_code=401, content={"detail": "invalid signature"})
 
-    expected = hmac.new(
-        settings.WEBHOOK_SECRET.encode(),
-        raw_body,
-        hashlib.sha256,
-    ).hexdigest()
+    expected = hmac.digest(_SECRET_BYTES, raw_body, "sha256")
+    try:
+        provided = bytes.fromhex(x_signature)
+    except ValueError:
+        provided = b""
 
-    if not hmac.compare_digest(x_signature, expected):
+    if not hmac.compare_digest(provided, expected):
         latency_ms = (time.time() - start_time) * 1000
         metrics.record_http_request("/webhook", 401)
         metrics.record_webhook_result("invalid_signature")
         metrics.record_latency(latency_ms)
         log_request(request_id, "POST", "/webhook", 401, latency_ms, extra={"result": "invalid_signature"})
-        return JSONResponse(status_code=401, content={"detail": "invalid signature"})
+        return ORJSONResponse(status_code=401, content={"detail": "invalid signature"})
 
-    # 3. Parse JSON and validate
+    # 3. Parse JSON (reusing the body already read for HMAC) and validate
     try:
-        data = await request.json()
-        msg = MessageRequest(**data)
-    except Exception as e:
+        msg = validate_webhook(orjson.loads(raw_body))
+    except (orjson.JSONDecodeError, WebhookValidationError) as e:
         latency_ms = (time.time() - start_time) * 1000
         metrics.record_http_request("/webhook", 422)
         metrics.record_webhook_result("validation_error")
@@ -204,41 +281,22 @@ async def webhook(request: Request, db: Session = Depends(get_db)):
             latency_ms,
             extra={"result": "validation_error", "error": str(e)},
         )
-        return JSONResponse(status_code=422, content={"detail": str(e)})
+        return ORJSONResponse(status_code=422, content={"detail": str(e)})
 
-    # 4. Insert into DB with idempotency
+    # 4. Insert into DB; a duplicate message_id is skipped by the database
     try:
-        new_msg = Message(
-            message_id=msg.message_id,
-            from_msisdn=msg.from_field,
-            to_msisdn=msg.to,
-            ts=msg.ts,
-            text=msg.text,
-            created_at=datetime.utcnow().isoformat() + "Z",
-        )
-        db.add(new_msg)
-        db.commit()
-
-        latency_ms = (time.time() - start_time) * 1000
-        metrics.record_http_request("/webhook", 200)
-        metrics.record_webhook_result("created")
-        metrics.record_latency(latency_ms)
-        log_request(
-            request_id,
-            "POST",
-            "/webhook",
-            200,
-            latency_ms,
-            extra={"message_id": msg.message_id, "dup": False, "result": "created"},
+        stmt = insert_ignore(
+            Message,
+            **msg._asdict(),
+            created_at=time.time_ns() // 1_000_000,
         )
-        return JSONResponse(status_code=200, content={"status": "ok"})
+        dup = (await db.execute(stmt)).rowcount == 0
+        await db.commit()
 
-    except IntegrityError:
-        # Duplicate message_id → idempotent success
-        db.rollback()
+        result = "duplicate" if dup else "created"
         latency_ms = (time.time() - start_time) * 1000
         metrics.record_http_request("/webhook", 200)
-        metrics.record_webhook_result("duplicate")
+        metrics.record_webhook_result(result)
         metrics.record_latency(latency_ms)
         log_request(
             request_id,
@@ -246,12 +304,12 @@ async def webhook(request: Request, db: Session = Depends(get_db)):
             "/webhook",
             200,
             latency_ms,
-            extra={"message_id": msg.message_id, "dup": True, "result": "duplicate"},
+            extra={"message_id": msg.message_id, "dup": dup, "result": result},
         )
-        return JSONResponse(status_code=200, content={"status": "ok"})
+        return ORJSONResponse(status_code=200, content={"status": "ok"})
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         latency_ms = (time.time() - start_time) * 1000
         metrics.record_http_request("/webhook", 500)
         metrics.record_webhook_result("error")
@@ -264,53 +322,86 @@ async def webhook(request: Request, db: Session = Depends(get_db)):
             latency_ms,
             extra={"result": "error", "error": str(e)},
         )
-        return JSONResponse(status_code=500, content={"detail": "Internal server error"})
+        return ORJSONResponse(status_code=500, content={"detail": "Internal server error"})
 
 
 # ==================== Messages Endpoint ====================
 
+def _encode_cursor(ts: str, message_id: str) -> str:
+    """Opaque keyset cursor for the last row of a /messages page."""
+    return base64.urlsafe_b64encode(orjson.dumps([ts, message_id])).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    ts, message_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(ts, str) or not isinstance(message_id, str):
+        raise ValueError("cursor must encode [ts, message_id]")
+    return ts, message_id
+
+
 @app.get("/messages", response_model=MessagesListResponse)
 def get_messages(
     limit: int = 50,
-    offset: int = 0,
+    cursor: Optional[str] = None,
     from_: Optional[str] = None,
     since: Optional[str] = None,
     q: Optional[str] = None,
+    include_total: bool = False,
     db: Session = Depends(get_db),
 ):
     """
-    List messages with pagination and filters:
+    List messages with keyset pagination and filters:
     - limit: 1–100 (default 50)
-    - offset: >= 0
+    - cursor: next_cursor from the previous page
     - from_: exact match on from_msisdn
     - since: ts >= since
     - q: case-insensitive substring match on text
+    - include_total: also count all matching rows (extra query)
     """
     request_id = str(uuid.uuid4())
     start_time = time.time()
 
     if limit < 1 or limit > 100:
         limit = 50
-    if offset < 0:
-        offset = 0
 
-    query = db.query(Message)
+    if cursor:
+        try:
+            cursor_ts, cursor_id = _decode_cursor(cursor)
+        except Exception:
+            latency_ms = (time.time() - start_time) * 1000
+            metrics.record_http_request("/messages", 400)
+            metrics.record_latency(latency_ms)
+            log_request(request_id, "GET", "/messages", 400, latency_ms, extra={"reason": "invalid_cursor"})
+            return ORJSONResponse(status_code=400, content={"detail": "invalid cursor"})
+
+    query = db.query(
+        Message.message_id,
+        Message.from_msisdn,
+        Message.to_msisdn,
+        Message.ts,
+        Message.text,
+    )
 
     if from_:
         query = query.filter(Message.from_msisdn == from_)
     if since:
         query = query.filter(Message.ts >= since)
     if q:
-        query = query.filter(Message.text.ilike(f"%{q}%"))
+        query = query.filter(text_search_filter(q))
+
+    total = query.count() if include_total else None
 
-    total = query.count()
+    if cursor:
+        query = query.filter(tuple_(Message.ts, Message.message_id) > (cursor_ts, cursor_id))
 
     messages = (
         query.order_by(Message.ts.asc(), Message.message_id.asc())
-        .limit(limit)
-        .offset(offset)
+        .limit(limit + 1)
         .all()
     )
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    next_cursor = _encode_cursor(messages[-1].ts, messages[-1].message_id) if has_more else None
 
     latency_ms = (time.time() - start_time) * 1000
     metrics.record_http_request("/messages", 200)
@@ -321,14 +412,19 @@ def get_messages(
         "/messages",
         200,
         latency_ms,
-        extra={"limit": limit, "offset": offset, "total": total},
+        extra={"limit": limit, "has_more": has_more, "total": total},
     )
 
-    return MessagesListResponse(
-        data=[MessageResponse.from_orm(m) for m in messages],
-        total=total,
-        limit=limit,
-        offset=offset,
+    # Rows already match MessageResponse; return them directly so FastAPI
+    # skips per-row model validation (response_model still documents it).
+    return ORJSONResponse(
+        content={
+            "data": [m._asdict() for m in messages],
+            "limit": limit,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            "total": total,
+        }
     )
 
 
@@ -346,8 +442,12 @@ def get_stats(db: Session = Depends(get_db)):
     request_id = str(uuid.uuid4())
     start_time = time.time()
 
-    total_messages = db.query(Message).count()
-    senders_count = db.query(Message.from_msisdn).distinct().count()
+    total_messages, senders_count, first_message_ts, last_message_ts = db.query(
+        func.count(),
+        func.count(func.distinct(Message.from_msisdn)),
+        func.min(Message.ts),
+        func.max(Message.ts),
+    ).one()
 
     top_senders = (
         db.query(Message.from_msisdn, func.count().label("count"))
@@ -360,9 +460,6 @@ def get_stats(db: Session = Depends(get_db)):
         SenderStat(from_msisdn=s[0], count=s[1]) for s in top_senders
     ]
 
-    first_message_ts = db.query(func.min(Message.ts)).scalar()
-    last_message_ts = db.query(func.max(Message.ts)).scalar()
-
     latency_ms = (time.time() - start_time) * 1000
     metrics.record_http_request("/stats", 200)
     metrics.record_latency(latency_ms)
@@ -392,5 +489,4 @@ def get_metrics():
     metrics.record_latency(latency_ms)
     log_request(request_id, "GET", "/metrics", 200, latency_ms)
 
-    # FastAPI will return plain text here; it's fine for the assignment
-    return body
+    return Response(content=body, media_type="text/plain; version=0.0.4")
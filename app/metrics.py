@@ -1,35 +1,51 @@
-from collections import defaultdict
-from typing import Dict, List
+import statistics
+from collections import defaultdict, deque
+from typing import Deque, Dict, Tuple
+
+RECENT_LATENCIES = 4096
 
 class MetricsCollector:
     def __init__(self):
-        self.http_requests_total: Dict[str, int] = defaultdict(int)
+        self.http_requests_total: Dict[Tuple[str, int], int] = defaultdict(int)
         self.webhook_requests_total: Dict[str, int] = defaultdict(int)
-        self.request_latencies: List[float] = []
+        # Non-cumulative counts for le=100, le=500, le=+Inf; summed on export
+        self._buckets = [0, 0, 0]
+        self._count = 0
+        # Most recent latencies only, for p50/p95/p99 at bounded memory
+        self.request_latencies: Deque[float] = deque(maxlen=RECENT_LATENCIES)
 
     def record_http_request(self, path: str, status: int) -> None:
-        key = f'{{"path":"{path}","status":{status}}}'
-        self.http_requests_total[key] += 1
+        self.http_requests_total[(path, status)] += 1
 
     def record_webhook_result(self, result: str) -> None:
-        key = f'{{"result":"{result}"}}'
-        self.webhook_requests_total[key] += 1
+        self.webhook_requests_total[result] += 1
 
     def record_latency(self, latency_ms: float) -> None:
+        if latency_ms <= 100:
+            self._buckets[0] += 1
+        elif latency_ms <= 500:
+            self._buckets[1] += 1
+        else:
+            self._buckets[2] += 1
+        self._count += 1
         self.request_latencies.append(latency_ms)
 
-    def export_prometheus(self) -> str:
-        lines = []
-        for key, count in self.http_requests_total.items():
-            lines.append(f"http_requests_total{key} {count}")
-        for key, count in self.webhook_requests_total.items():
-            lines.append(f"webhook_requests_total{key} {count}")
-        if self.request_latencies:
-            latencies = sorted(self.request_latencies)
-            lines.append(f"request_latency_ms_count {len(latencies)}")
-            lines.append(f"request_latency_ms_bucket{{le=\"100\"}} {sum(1 for l in latencies if l <= 100)}")
-            lines.append(f"request_latency_ms_bucket{{le=\"500\"}} {sum(1 for l in latencies if l <= 500)}")
-            lines.append(f"request_latency_ms_bucket{{le=\"+Inf\"}} {len(latencies)}")
-        return "\n".join(lines)
+    def export_prometheus(self) -> bytes:
+        buf = bytearray()
+        for (path, status), count in self.http_requests_total.items():
+            buf += b'http_requests_total{"path":"%s","status":%d} %d\n' % (path.encode(), status, count)
+        for result, count in self.webhook_requests_total.items():
+            buf += b'webhook_requests_total{"result":"%s"} %d\n' % (result.encode(), count)
+        if self._count:
+            le_100, le_500, _ = self._buckets
+            buf += b"request_latency_ms_count %d\n" % self._count
+            buf += b'request_latency_ms_bucket{le="100"} %d\n' % le_100
+            buf += b'request_latency_ms_bucket{le="500"} %d\n' % (le_100 + le_500)
+            buf += b'request_latency_ms_bucket{le="+Inf"} %d\n' % self._count
+        if len(self.request_latencies) >= 2:
+            cuts = statistics.quantiles(list(self.request_latencies), n=100, method="inclusive")
+            for quantile, value in ((b"0.5", cuts[49]), (b"0.95", cuts[94]), (b"0.99", cuts[98])):
+                buf += b'request_latency_ms_recent{quantile="%s"} %.2f\n' % (quantile, value)
+        return bytes(buf)
 
 metrics = MetricsCollector()
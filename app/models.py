@@ -1,14 +1,17 @@
-from sqlalchemy import Column, String, Text
+from sqlalchemy import BigInteger, Column, Index, String, Text
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_from_ts", "from_msisdn", "ts"),
+    )
 
     message_id = Column(String, primary_key=True, index=True)
-    from_msisdn = Column(String, nullable=False, index=True)
+    from_msisdn = Column(String, nullable=False)
     to_msisdn = Column(String, nullable=False)
     ts = Column(String, nullable=False, index=True)
     text = Column(Text, nullable=True)
-    created_at = Column(String, nullable=False)
+    created_at = Column(BigInteger, nullable=False)  # epoch milliseconds
@@ -1,20 +1,157 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import Integer, column, create_engine, event, inspect, make_url, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
-from app.config import get_settings
-from app.models import Base
-
-settings = get_settings()
+from app.config import settings
+from app.models import Base, Message
 
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {},
+    pool_pre_ping=True,
+)
+
+# Async drivers for the same database, used by the webhook write path
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+_async_url = make_url(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    _async_url.set(drivername=_ASYNC_DRIVERS.get(_async_url.get_backend_name(), _async_url.drivername)),
+    pool_pre_ping=True,
 )
 
+def _set_sqlite_pragmas(dbapi_conn, _) -> None:
+    # WAL + synchronous=NORMAL: commits append to the WAL without an
+    # fsync each, and readers don't block the webhook writer.
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.close()
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# SQLite only: a trigram FTS5 index over messages.text, kept in sync by
+# triggers, so "q" substring searches don't scan the whole table.
+_FTS_TABLE_DDL = (
+    "CREATE VIRTUAL TABLE messages_fts USING fts5(message_id UNINDEXED, text, tokenize='trigram')",
+    "INSERT INTO messages_fts(message_id, text) SELECT message_id, text FROM messages",
+)
+# Run on every startup: rebuilding the messages table drops its triggers
+_FTS_TRIGGER_DDL = (
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(message_id, text) VALUES (new.message_id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "DELETE FROM messages_fts WHERE message_id = old.message_id; END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN "
+    "UPDATE messages_fts SET text = new.text WHERE message_id = old.message_id; END",
+)
+
+# created_at used to be an ISO-8601 string; convert to epoch milliseconds.
+# Values that are already all digits are kept as-is.
+_SQLITE_CREATED_AT_MS = (
+    "CASE WHEN created_at != '' AND created_at NOT GLOB '*[^0-9]*' THEN CAST(created_at AS INTEGER) "
+    "ELSE COALESCE(CAST(ROUND((julianday(created_at) - 2440587.5) * 86400000.0) AS INTEGER), 0) END"
+)
+_POSTGRES_CREATED_AT_MS = (
+    "CASE WHEN created_at ~ '^[0-9]+$' THEN CAST(created_at AS BIGINT) "
+    "ELSE CAST(EXTRACT(EPOCH FROM CAST(created_at AS TIMESTAMPTZ)) * 1000 AS BIGINT) END"
+)
+
+_fts_enabled = False
+
+def _created_at_is_integer(conn) -> bool:
+    columns = {c["name"]: c["type"] for c in inspect(conn).get_columns("messages")}
+    return isinstance(columns["created_at"], Integer)
+
+def _rebuild_sqlite_messages(conn) -> None:
+    # SQLite can't change a column type in place: rebuild the table.
+    # A leftover messages_old means an earlier rebuild was cut short after
+    # the rename; finish its copy instead of starting over.
+    if "messages_old" not in inspect(conn).get_table_names():
+        if _created_at_is_integer(conn):
+            return
+        for index in inspect(conn).get_indexes("messages"):
+            conn.exec_driver_sql(f"DROP INDEX {index['name']}")
+        conn.exec_driver_sql("ALTER TABLE messages RENAME TO messages_old")
+        Message.__table__.create(conn)
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO messages (message_id, from_msisdn, to_msisdn, ts, text, created_at) "
+        f"SELECT message_id, from_msisdn, to_msisdn, ts, text, {_SQLITE_CREATED_AT_MS} FROM messages_old"
+    )
+    conn.exec_driver_sql("DROP TABLE messages_old")
+
+def _migrate_created_at() -> None:
+    """Convert a pre-existing string created_at column to BIGINT epoch ms."""
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            if not _created_at_is_integer(conn):
+                conn.execute(text(
+                    f"ALTER TABLE messages ALTER COLUMN created_at TYPE BIGINT USING ({_POSTGRES_CREATED_AT_MS})"
+                ))
+        return
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as conn:
+        # pysqlite commits implicitly around DDL, so take over transaction
+        # control to make the rebuild all-or-nothing. BEGIN IMMEDIATE also
+        # makes a second worker wait here rather than rebuild concurrently.
+        dbapi_conn = conn.connection.driver_connection
+        dbapi_conn.isolation_level = None
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                _rebuild_sqlite_messages(conn)
+            except BaseException:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            conn.exec_driver_sql("COMMIT")
+        finally:
+            dbapi_conn.isolation_level = ""
 
 def init_db() -> None:
+    global _fts_enabled
     Base.metadata.create_all(bind=engine)
+    _migrate_created_at()
+    with engine.begin() as conn:
+        # create_all skips indexes on tables that already exist
+        for index in Message.__table__.indexes:
+            index.create(conn, checkfirst=True)
+        # Superseded by the composite ix_messages_from_ts
+        conn.execute(text("DROP INDEX IF EXISTS ix_messages_from_msisdn"))
+    if engine.dialect.name != "sqlite":
+        return
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")
+            ).first()
+            if not exists:
+                for stmt in _FTS_TABLE_DDL:
+                    conn.execute(text(stmt))
+            for stmt in _FTS_TRIGGER_DDL:
+                conn.execute(text(stmt))
+    except OperationalError:
+        # No FTS5 / trigram tokenizer (SQLite < 3.34): "q" falls back to ILIKE
+        return
+    _fts_enabled = True
+
+def text_search_filter(q: str):
+    """Case-insensitive substring match on Message.text, via the FTS index when present."""
+    pattern = f"%{q}%"
+    if _fts_enabled:
+        matches = text("SELECT message_id FROM messages_fts WHERE text LIKE :pattern").bindparams(pattern=pattern)
+        return Message.message_id.in_(matches.columns(column("message_id")))
+    return Message.text.ilike(pattern)
 
 def get_db() -> Session:
     db = SessionLocal()
@@ -23,6 +160,17 @@ def get_db() -> Session:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncSession:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def insert_ignore(model, **values):
+    """INSERT ... ON CONFLICT DO NOTHING on the model's primary key."""
+    insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+    return insert(model).values(**values).on_conflict_do_nothing(
+        index_elements=[c.name for c in model.__table__.primary_key]
+    )
+
 def db_health_check(db: Session) -> bool:
     try:
         db.execute(text("SELECT 1"))
@@ -0,0 +1,100 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+from app import storage
+
+BASELINE_SCHEMA = """
+CREATE TABLE messages (
+    message_id VARCHAR NOT NULL,
+    from_msisdn VARCHAR NOT NULL,
+    to_msisdn VARCHAR NOT NULL,
+    ts VARCHAR NOT NULL,
+    text TEXT,
+    created_at VARCHAR NOT NULL,
+    PRIMARY KEY (message_id)
+);
+CREATE INDEX ix_messages_ts ON messages (ts);
+CREATE INDEX ix_messages_from_msisdn ON messages (from_msisdn);
+CREATE INDEX ix_messages_message_id ON messages (message_id);
+"""
+
+BASELINE_ROWS = [
+    ("m1", "+111", "+999", "2025-01-01T00:00:00Z", "hello", "2025-01-15T10:00:00.250000Z"),
+    ("m2", "+222", "+999", "2025-01-02T00:00:00Z", None, "2025-01-15T10:00:01Z"),
+    ("m3", "+111", "+999", "2025-01-03T00:00:00Z", "again", "1736935202000"),
+]
+
+# Epoch ms for the created_at values above
+EXPECTED_CREATED_AT = {"m1": 1736935200250, "m2": 1736935201000, "m3": 1736935202000}
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "app.db"
+    monkeypatch.setattr(storage, "engine", create_engine(f"sqlite:///{path}"))
+    return path
+
+
+def _seed(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", BASELINE_ROWS)
+    conn.commit()
+    conn.close()
+
+
+def _created_at(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT message_id, created_at, typeof(created_at) FROM messages").fetchall()
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    return rows, tables
+
+
+def test_init_db_migrates_string_created_at_to_epoch_ms(db_path):
+    _seed(db_path)
+
+    storage.init_db()
+    storage.init_db()  # second run is a no-op
+
+    rows, tables = _created_at(db_path)
+    assert {r[0]: r[1] for r in rows} == EXPECTED_CREATED_AT
+    assert {r[2] for r in rows} == {"integer"}
+    assert "messages_old" not in tables
+
+
+def test_init_db_rolls_back_failed_migration(db_path, monkeypatch):
+    _seed(db_path)
+    # abs() of INT64_MIN raises "integer overflow" during the row copy
+    monkeypatch.setattr(storage, "_SQLITE_CREATED_AT_MS", "abs(-9223372036854775807 - 1)")
+
+    with pytest.raises(Exception):
+        storage.init_db()
+
+    rows, tables = _created_at(db_path)
+    assert len(rows) == len(BASELINE_ROWS)
+    assert {r[2] for r in rows} == {"text"}
+    assert "messages_old" not in tables
+
+
+def test_init_db_resumes_interrupted_rebuild(db_path):
+    # State left by a rebuild cut short after the rename: the old rows sit
+    # in messages_old next to an empty, already-migrated messages table.
+    _seed(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("ALTER TABLE messages RENAME TO messages_old")
+    conn.execute(
+        "CREATE TABLE messages (message_id VARCHAR NOT NULL, from_msisdn VARCHAR NOT NULL, "
+        "to_msisdn VARCHAR NOT NULL, ts VARCHAR NOT NULL, text TEXT, created_at BIGINT NOT NULL, "
+        "PRIMARY KEY (message_id))"
+    )
+    conn.commit()
+    conn.close()
+
+    storage.init_db()
+
+    rows, tables = _created_at(db_path)
+    assert {r[0]: r[1] for r in rows} == EXPECTED_CREATED_AT
+    assert "messages_old" not in tables